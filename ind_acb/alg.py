@@ -1,19 +1,61 @@
 """Code for recommendation algorithms."""
+import functools
 import math
-import random
 from abc import ABC, abstractmethod
-from collections import Counter
 from typing import Optional
 
 import numpy as np
 
+from ind_acb.misc import CachedLog
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional: RUCB falls back to pure NumPy
+    njit = None
+
+try:
+    import numexpr as ne
+except ImportError:  # numexpr is optional: only used to fuse U = base + c * bonus for large K
+    ne = None
+
+_NUMEXPR_MIN_SIZE = 128 * 128  # below this, numexpr's call overhead outweighs fusing
+
 
 class BaseAlgPolicy(ABC):
     def __init__(self, Q: int = 2):
         super().__init__()
         self.Q = Q
         self.reset()
-        self.rng = random.Random()
+        self.rng = np.random.default_rng()
+
+    @property
+    def rng(self) -> np.random.Generator:
+        """
+        Source of randomness: a np.random.Generator (not a random.Random).
+
+        Assigning a new generator (or calling `seed`) discards any uniforms
+        already pooled from the old one, so it takes effect immediately.
+        """
+        return self._rng
+
+    @rng.setter
+    def rng(self, rng: np.random.Generator):
+        self._rng = rng
+        self._uni_buf: list[float] = []  # pool of pre-generated uniform random numbers
+        self._uni_i = 0
+
+    def seed(self, seed: Optional[int] = None) -> None:
+        """Reseed the policy's randomness."""
+        self.rng = np.random.default_rng(seed)
+
+    def _next_uni(self) -> float:
+        """Uniform random number in [0, 1), drawn from a pool which is refilled in bulk."""
+        if self._uni_i == len(self._uni_buf):
+            self._uni_buf = self._rng.random(4096).tolist()
+            self._uni_i = 0
+        u = self._uni_buf[self._uni_i]
+        self._uni_i += 1
+        return u
 
     @abstractmethod
     def choose_action_set(self, time: int, all_actions: list[int]) -> list[int]:
@@ -28,32 +70,187 @@ class BaseAlgPolicy(ABC):
         raise NotImplementedError
 
 
+def _make_rucb_step(K: int):
+    """
+    Make the RUCB step kernel for K arms (K is a constant, so compiled loops can be unrolled).
+
+    The kernel runs lines 4-12 of RUCB as a single loop-based function:
+    rucb_step(base, bonus, sqrt_c, B, u1, u2, u3) -> (a_c, d, new_B).
+    U = base + sqrt_c * bonus is never materialized; with float32 inputs it is
+    rounded exactly as in `RUCB._get_U_and_C`, so ties are exact. B is the B set as an
+    int64 bitmask, so K must be at most 63. u1, u2, u3 are independent
+    uniform random numbers in [0, 1).
+    """
+
+    def rucb_step(base, bonus, sqrt_c, B, u1, u2, u3):
+        # C (bitmask): rows of U which are all >= 0.5
+        C = 0
+        n_C = 0
+        for i in range(K):
+            row_ok = True
+            for j in range(K):
+                if base[i, j] + sqrt_c * bonus[i, j] < 0.5:
+                    row_ok = False
+                    break
+            if row_ok:
+                C |= 1 << i
+                n_C += 1
+        if n_C == 0:
+            C = 1 << min(int(u1 * K), K - 1)
+            n_C = 1
+
+        # B set
+        B &= C
+
+        # Pick a_c
+        a_c = -1
+        if n_C == 1:
+            B = C
+            for i in range(K):
+                if (C >> i) & 1:
+                    a_c = i
+        elif B != 0 and u2 < 0.5:
+            for i in range(K):  # first item of B
+                if (B >> i) & 1:
+                    a_c = i
+                    break
+        else:
+            # k-th item of C, not in B
+            C_minus_B = C & ~B
+            n = 0
+            for i in range(K):
+                n += (C_minus_B >> i) & 1
+            k = min(int(u1 * n), n - 1)
+            for i in range(K):
+                if (C_minus_B >> i) & 1:
+                    if k == 0:
+                        a_c = i
+                        break
+                    k -= 1
+
+        # Pick arm d with correct tie breaking (d =/= c for ties)
+        max_u = base[0, a_c] + sqrt_c * bonus[0, a_c]
+        for i in range(1, K):
+            max_u = max(max_u, base[i, a_c] + sqrt_c * bonus[i, a_c])
+        n_d = 0
+        for i in range(K):
+            if i != a_c and base[i, a_c] + sqrt_c * bonus[i, a_c] >= max_u:
+                n_d += 1
+        if n_d == 0:
+            return a_c, a_c, B
+        k = min(int(u3 * n_d), n_d - 1)
+        for i in range(K):
+            if i != a_c and base[i, a_c] + sqrt_c * bonus[i, a_c] >= max_u:
+                if k == 0:
+                    return a_c, i, B
+                k -= 1
+        return a_c, a_c, B  # unreachable
+
+    return rucb_step
+
+
+if njit is not None:
+
+    @functools.lru_cache(maxsize=None)
+    def _rucb_step_for(K: int):
+        """Compiled RUCB step kernel for K arms (one specialization per K)."""
+        # No fastmath: contracting into FMAs would round U differently from the NumPy path
+        return njit(cache=True)(_make_rucb_step(K))
+
+else:
+    _rucb_step_for = None
+
+
 class RUCB(BaseAlgPolicy):
     def reset(self):
         assert self.Q == 2, "Only for Q=2"
         self.W = None
         self.alpha = 1.0
-        self.B = set()
+        self.B = 0  # the B set, as a bitmask over action idxs
+        self._all_actions = None  # all_actions list that W and B were last checked against
+        self._log_time = CachedLog()
+
+        # Caches derived from W, so that U = base + sqrt(alpha * log(t)) * bonus.
+        # They are updated incrementally in `record_action` and rebuilt
+        # whenever W is replaced.
+        self._stats_valid = False
+        self._S = None  # W + W^T
+        self._base = None  # W / S (1 where S == 0, 0.5 on the diagonal)
+        self._bonus = None  # sqrt(1 / S) (0 where S == 0 and on the diagonal)
+        self._U = None
+        self._step = None  # compiled kernel for len(W) arms (None: use NumPy)
+
+    @property
+    def W(self) -> Optional[np.ndarray]:
+        """
+        Win counts: W[i, j] is the number of times i was chosen over j.
+
+        This is a read-only view: W can only be changed by assigning a new
+        array (which is copied), or through `record_action(_batch)`.
+        """
+        return self._W_view
+
+    @W.setter
+    def W(self, W: Optional[np.ndarray]):
+        self._W = None if W is None else np.array(W)
+        self._W_view = None if W is None else self._W.view()
+        if self._W_view is not None:
+            self._W_view.flags.writeable = False
+        self._stats_valid = False
+        self._all_actions = None  # re-create/re-check W against all_actions at the next call
+
+    def _rebuild_stats(self):
+        """Build the S, base and bonus caches (float32, to halve memory traffic) from scratch."""
+        K = len(self.W)
+        S = self.W + self.W.T
+        inv_S = np.zeros((K, K), dtype=np.float32)
+        np.divide(1.0, S, out=inv_S, where=S != 0)
+        base = np.multiply(self.W, inv_S, out=np.empty((K, K), dtype=np.float32))
+        base[S == 0] = 1.0  # no comparisons yet: optimistic
+        bonus = np.sqrt(inv_S, out=inv_S)
+        np.fill_diagonal(base, 0.5)  # fill exact diagonal
+        np.fill_diagonal(bonus, 0.0)
+        self._S, self._base, self._bonus = S, base, bonus
+        self._U = np.empty((K, K), dtype=np.float32)  # scratch for U
+        # The kernel stores B in an int64 bitmask
+        self._step = _rucb_step_for(K) if _rucb_step_for is not None and K <= 63 else None
+        self._stats_valid = True
+
+    def _update_stats(self, i: int, j: int):
+        """Refresh the cached entries (i, j) and (j, i) after W[i, j] changed."""
+        if i == j:
+            return  # diagonal of U is always 0.5
+        s = self._S[i, j] + 1
+        self._S[i, j] = self._S[j, i] = s
+        inv_s = np.float32(1.0 / s)  # rounded exactly as in `_rebuild_stats`
+        self._base[i, j] = self._W[i, j] * inv_s
+        self._base[j, i] = self._W[j, i] * inv_s
+        self._bonus[i, j] = self._bonus[j, i] = math.sqrt(inv_s)
 
     def _get_U_and_C(self, time: int, all_actions: list[int]):
         """
         Run lines 4-6 of the algorithm, computing the U and C matrix.
+
+        NOTE: U is a scratch buffer which is overwritten on the next call.
         """
 
-        # Create U matrix
-        W_plus_W_T = self.W + self.W.T
-        with np.errstate(invalid="ignore", divide="ignore"):
-            U = self.W / W_plus_W_T + np.sqrt(self.alpha * math.log(time) / W_plus_W_T)
-        assert not np.any(np.isinf(U))  # just NaNs
-        U = np.nan_to_num(U, nan=1.0)
-        for i in range(len(U)):
-            U[i, i] = 0.5  # fill exact diagonal
-
-        # Create C set
-        C = set()
-        for i, _ in enumerate(all_actions):
-            if np.all(U[i] >= 0.5):
-                C.add(i)  # append action idxs
+        # Create U matrix: W / S + sqrt(alpha * log(t) / S), with S = W + W^T.
+        # Only the scalar sqrt(alpha * log(t)) changes between steps.
+        if not self._stats_valid:
+            self._rebuild_stats()
+        sqrt_c = np.float32(math.sqrt(self.alpha * self._log_time(time)))
+        if ne is not None and self._U.size >= _NUMEXPR_MIN_SIZE:
+            U = ne.evaluate(
+                "base + c * bonus",
+                local_dict={"base": self._base, "bonus": self._bonus, "c": sqrt_c},
+                out=self._U,
+            )
+        else:
+            U = np.multiply(self._bonus, sqrt_c, out=self._U)
+            U += self._base
+
+        # Create C: array of action idxs whose whole row of U is >= 0.5
+        C = np.flatnonzero((U >= 0.5).all(axis=1))
 
         return U, C
 
@@ -62,8 +259,7 @@ class RUCB(BaseAlgPolicy):
         U, C = self._get_U_and_C(time, all_actions)
 
         # Compute possible values for a_c
-        if len(C) == 0:
-            C.update(all_actions)
+        C = C.tolist() if C.size > 0 else list(all_actions)
 
         # If c is the unique maximizer of max_j(U_cj) for ALL c in C,
         # then the policy will definitely self-duel.
@@ -74,65 +270,114 @@ class RUCB(BaseAlgPolicy):
         return True
 
     def choose_action_set(self, time: int, all_actions: list[int]):
-        # Init W
-        if self.W is None:
-            self.W = np.zeros((len(all_actions), len(all_actions)), dtype=int)
+        return self.choose_action_batch(time, 1, all_actions)[0]
+
+    def choose_action_batch(self, time: int, batch_size: int, all_actions: list[int]) -> list[list[int]]:
+        """
+        Choose `batch_size` action sets at once, all using the U matrix at `time`.
+
+        U is not updated within a batch (batched feedback), which amortizes the
+        per-step overhead over the batch. batch_size=1 is the standard algorithm.
+        """
+        # all_actions is normally the same list at every step: only check it when it changes
+        if all_actions is not self._all_actions:
+            self._init_actions(all_actions)
+        if not self._stats_valid:
+            self._rebuild_stats()
+
+        # Fast path: numba kernel
+        if self._step is not None:
+            sqrt_c = np.float32(math.sqrt(self.alpha * self._log_time(time)))  # U in float32, as in `_get_U_and_C`
+            action_sets = []
+            for _ in range(batch_size):
+                a_c, d, self.B = self._step(
+                    self._base, self._bonus, sqrt_c, self.B, self._next_uni(), self._next_uni(), self._next_uni()
+                )
+                action_sets.append([a_c, d])
+            return action_sets
 
-        # Find U and C, filling C if it is empty
         U, C = self._get_U_and_C(time, all_actions)
-        if len(C) == 0:
-            C = {int(self.rng.choice(all_actions))}
+        return [self._pick_action_set(U, C) for _ in range(batch_size)]
+
+    def _init_actions(self, all_actions: list[int]):
+        """Create W for `all_actions` if needed."""
+        K = len(all_actions)
+        if self.W is None:
+            self.W = np.zeros((K, K), dtype=np.int32)
+        assert self.W.shape == (K, K)
+        self._all_actions = all_actions
+
+    def _pick_action_set(self, U: np.ndarray, C: np.ndarray) -> list[int]:
+        """Run lines 7-12 of the algorithm (NumPy version of the `_make_rucb_step` kernel)."""
+
+        # Fill C if it is empty
+        if C.size == 0:
+            C = np.array([int(self._next_uni() * len(U))])
 
         # B set
-        self.B = self.B & C
+        C = C.tolist()
+        C_mask = 0
+        for c in C:
+            C_mask |= 1 << c
+        self.B &= C_mask
 
         # Pick a_c
         if len(C) == 1:
-            a_c = list(C)[0]
-            self.B = set(C)
+            a_c = C[0]
+            self.B = C_mask
         else:
-            if self.rng.random() < 0.5 and len(self.B) > 0:
-                a_c = list(self.B)[0]
+            if self._next_uni() < 0.5 and self.B != 0:
+                a_c = (self.B & -self.B).bit_length() - 1  # first item of B
             else:
                 # sample an item from C, not in B
-                a_c = int(self.rng.choice([x for x in C if x not in self.B]))
+                C_minus_B = [c for c in C if not (self.B >> c) & 1]
+                a_c = C_minus_B[int(self._next_uni() * len(C_minus_B))]
 
         # Pick arm d with correct tie breaking
-        max_u = np.max(U[:, a_c])
-        d_candidates = set(np.where(U[:, a_c] >= max_u)[0])
-        if len(d_candidates) > 1:
-            d_candidates.discard(a_c)  # d =/= c for ties
+        U_c = U[:, a_c]
+        d_candidates = np.flatnonzero(U_c >= U_c.max())
+        if d_candidates.size > 1:
+            d_candidates = d_candidates[d_candidates != a_c]  # d =/= c for ties
 
         # Return action
-        return [a_c, int(self.rng.choice(list(d_candidates)))]
+        return [a_c, int(d_candidates[int(self._next_uni() * d_candidates.size)])]
 
     def record_action(self, time: int, available_actions: list[int], chosen_action: int) -> None:
         assert len(available_actions) == 2
 
-        # Find out which action was not chosen.
-        # Guess the first one, and move to the second if equal.
+        # Find out which action was not chosen: x ^ x == 0 cancels the chosen one.
         # Handles case of actions being equal
-        not_chosen_action = available_actions[0]
-        if not_chosen_action == chosen_action:
-            not_chosen_action = available_actions[1]
-        self.W[chosen_action, not_chosen_action] += 1
+        not_chosen_action = available_actions[0] ^ available_actions[1] ^ chosen_action
+        self._W[chosen_action, not_chosen_action] += 1
+        if self._stats_valid:
+            self._update_stats(chosen_action, not_chosen_action)
+
+    def record_action_batch(
+        self, times: list[int], available_actions: list[list[int]], chosen_actions: list[int]
+    ) -> None:
+        """Record the outcomes of a batch of duels, e.g. from `choose_action_batch`."""
+        available_actions = np.asarray(available_actions)
+        chosen_actions = np.asarray(chosen_actions)
+        assert available_actions.shape == (len(chosen_actions), 2)
+
+        not_chosen_actions = np.where(
+            available_actions[:, 0] == chosen_actions, available_actions[:, 1], available_actions[:, 0]
+        )
+        np.add.at(self._W, (chosen_actions, not_chosen_actions), 1)
+        self._stats_valid = False  # caches are rebuilt once at the next call
 
     def predict_winner(self, action_set: list[int]) -> Optional[int]:
         assert sorted(action_set) == list(range(len(action_set)))
         assert len(action_set) == len(self.W)
 
-        # Arm with highest predicted win rate
-        # print(policy.W)
-        with np.errstate(invalid="ignore", divide="ignore"):
-            pred_win_rates = self.W / (self.W + self.W.T)
-        pred_win_rates = np.nan_to_num(pred_win_rates, nan=0.5)
-        # print(pred_win_rates)
-        num_arms_beaten = (pred_win_rates > 0.5).astype(int).sum(axis=-1)
+        # Arm with highest predicted win rate.
+        # W[i, j] / (W[i, j] + W[j, i]) > 0.5 iff W[i, j] > W[j, i]
+        # (untried pairs and the diagonal count as 0.5, i.e. not beaten)
+        num_arms_beaten = (self.W > self.W.T).sum(axis=1, dtype=np.int64)
 
         # Handle tie breaking (return "None" if there is a tie)
-        max_beaten = np.max(num_arms_beaten)
-        counter = Counter(num_arms_beaten.tolist())
-        if counter[max_beaten] > 1:
+        best = int(num_arms_beaten.argmax())
+        if np.count_nonzero(num_arms_beaten == num_arms_beaten[best]) > 1:
             return None
         else:
-            return np.argmax(num_arms_beaten)
+            return best
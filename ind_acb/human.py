@@ -1,11 +1,11 @@
 """Code for human policies."""
 import math
 from abc import ABC, abstractmethod
+from typing import Optional
 
 import numpy as np
-from scipy import stats
 
-from ind_acb.misc import beta_dist_max_prob
+from ind_acb.misc import CachedLog, beta_dist_max_prob
 
 
 class BaseHumanPolicy(ABC):
@@ -42,21 +42,26 @@ class HumanUCB(BaseHumanPolicy, ExactProbHumanMixin):
 
     def reset(self):
         self.action_to_count = dict()
-        self.action_to_mean = dict()
+        self.action_to_sum = dict()
+        self._log_time = CachedLog()  # shared by all actions at one time step
 
     def _get_ucb(self, time: int, action: int) -> float:
-        return self.action_to_mean.get(action, math.inf) + self.ucb_constant * math.sqrt(
-            math.log(time) / self.action_to_count.get(action, 1)
-        )
+        return self._get_ucb_from_log_t(self._log_time(time), action)
+
+    def _get_ucb_from_log_t(self, log_t: float, action: int) -> float:
+        count = self.action_to_count.get(action)
+        if count is None:
+            return math.inf
+        return self.action_to_sum[action] / count + self.ucb_constant * math.sqrt(log_t / count)
 
     def choose_action(self, time: int, available_actions: list[int]) -> int:
-        argmax = np.argmax([self._get_ucb(time, a) for a in available_actions])
-        return available_actions[int(argmax)]
+        # Plain max (first maximizer wins ties, like np.argmax) avoids a list -> ndarray round trip
+        log_t = self._log_time(time)
+        return max(available_actions, key=lambda a: self._get_ucb_from_log_t(log_t, a))
 
     def record_reward(self, time: int, action: int, reward: float) -> None:
-        old_count = self.action_to_count.get(action, 0)
-        self.action_to_mean[action] = (self.action_to_mean.get(action, 0) * old_count + reward) / (old_count + 1)
-        self.action_to_count[action] = old_count + 1
+        self.action_to_sum[action] = self.action_to_sum.get(action, 0.0) + reward
+        self.action_to_count[action] = self.action_to_count.get(action, 0) + 1
 
     def action_choice_prob(self, time: int, a1: int, a2: int) -> float:
         ucb1 = self._get_ucb(time, a1)
@@ -73,17 +78,31 @@ class HumanThompsonSampling(BaseHumanPolicy, ExactProbHumanMixin):
     def __init__(self, alpha0: np.ndarray, beta0: np.ndarray):
         self.alpha0 = np.asarray(alpha0)
         self.beta0 = np.asarray(beta0)
+        self.rng = np.random.default_rng()  # source of randomness (see `seed`)
         super().__init__()
 
     def reset(self):
         self.alpha = self.alpha0.copy()
         self.beta = self.beta0.copy()
+        self._prob_cache = dict()  # (alpha1, beta1, alpha2, beta2) -> action_choice_prob
+
+    def seed(self, seed: Optional[int] = None) -> None:
+        """Reseed the policy's randomness."""
+        self.rng = np.random.default_rng(seed)
 
     def choose_action(self, time: int, available_actions: list[int]) -> int:
-        sample = stats.beta(self.alpha, self.beta).rvs()
-        return max(available_actions, key=lambda a: sample[a])
+        sample = self.rng.beta(self.alpha, self.beta)
+        return available_actions[int(sample[available_actions].argmax())]
+
+    def choose_action_many(self, time: int, available_actions: list[int], N: int) -> list[int]:
+        """Equivalent to N independent calls to `choose_action`, with all samples drawn at once."""
+        samples = self.rng.beta(
+            self.alpha[available_actions], self.beta[available_actions], size=(N, len(available_actions))
+        )
+        return [available_actions[i] for i in samples.argmax(axis=1).tolist()]
 
     def record_reward(self, time: int, action: int, reward: float) -> None:
+        self._prob_cache.clear()
         if reward == 1.0:
             self.alpha[action] += 1
         elif reward == 0.0:
@@ -92,5 +111,11 @@ class HumanThompsonSampling(BaseHumanPolicy, ExactProbHumanMixin):
             raise ValueError(reward)
 
     def action_choice_prob(self, time: int, a1: int, a2: int) -> float:
-        # Note: "0" below is because a1 is in index 0
-        return beta_dist_max_prob(self.alpha[[a1, a2]], self.beta[[a1, a2]], 0)
+        # Memoized since the integral is expensive and the posterior only changes in `record_reward`
+        key = (float(self.alpha[a1]), float(self.beta[a1]), float(self.alpha[a2]), float(self.beta[a2]))
+        prob = self._prob_cache.get(key)
+        if prob is None:
+            # Note: "0" below is because a1 is in index 0
+            prob = beta_dist_max_prob(self.alpha[[a1, a2]], self.beta[[a1, a2]], 0)
+            self._prob_cache[key] = prob
+        return prob
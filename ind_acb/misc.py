@@ -1,3 +1,5 @@
+import math
+
 import scipy.special as sp
 import scipy.stats as stats
 from scipy.integrate import quad
@@ -21,3 +23,17 @@ def beta_dist_max_prob(alpha, beta, i) -> float:
 
     result, _ = quad(integrand, 0, 1, limit=10_000)
     return result
+
+
+class CachedLog:
+    """log(x) which remembers the last value, e.g. for log(time) which only changes once per step."""
+
+    def __init__(self):
+        self._x = None
+        self._log_x = 0.0
+
+    def __call__(self, x: float) -> float:
+        if x != self._x:
+            self._log_x = math.log(x)
+            self._x = x
+        return self._log_x
@@ -3,6 +3,7 @@ from collections import Counter
 import numpy as np
 import pytest
 
+from ind_acb import alg as alg_module
 from ind_acb.alg import RUCB
 
 
@@ -10,6 +11,16 @@ def sigmoid(x):
     return 1 / (1 + np.exp(-x))
 
 
+@pytest.fixture(params=["numba", "numpy"])
+def rucb_kernel(request, monkeypatch):
+    """Run a test with both the numba kernel and the pure NumPy fallback."""
+    if request.param == "numba" and alg_module._rucb_step_for is None:
+        pytest.skip("numba not installed")
+    elif request.param == "numpy":
+        monkeypatch.setattr(alg_module, "_rucb_step_for", None)
+
+
+@pytest.mark.usefixtures("rucb_kernel")
 class TestRUCB:
     """Try to test RUCB."""
 
@@ -81,3 +92,87 @@ class TestRUCB:
             chosen_idx = 0 if rng.random() < sigmoid(utilities[A_t[0]] - utilities[A_t[1]]) else 1
             alg.record_action(t, A_t, A_t[chosen_idx])
         assert alg.predict_winner(arms) == np.argmax(utilities)
+
+    def test_best_arm_found_batched(self):
+        """Batched choices/feedback should still find the best arm."""
+        utilities = [1, 0, 0, 0, 0]
+        alg = RUCB()
+        rng = np.random.default_rng(0)
+        arms = list(range(len(utilities)))
+        batch_size = 100
+        for t in range(1, 100_000, batch_size):
+            A = alg.choose_action_batch(t, batch_size, arms)
+            chosen = [a[0] if rng.random() < sigmoid(utilities[a[0]] - utilities[a[1]]) else a[1] for a in A]
+            alg.record_action_batch(list(range(t, t + batch_size)), A, chosen)
+        assert alg.W.sum() == 100_000
+        assert alg.predict_winner(arms) == np.argmax(utilities)
+
+    def test_incremental_stats_match_rebuild(self):
+        """The incrementally-updated U matrix should match one rebuilt from W."""
+        alg = RUCB()
+        rng = np.random.default_rng(0)
+        arms = [0, 1, 2, 3]
+        for t in range(1, 200):
+            A_t = alg.choose_action_set(t, arms)
+            alg.record_action(t, A_t, A_t[int(rng.integers(2))])
+        U, C = alg._get_U_and_C(200, arms)
+        U = U.copy()  # U is a scratch buffer
+
+        alg.W = alg.W.copy()  # forces the caches to be rebuilt
+        U_rebuilt, C_rebuilt = alg._get_U_and_C(200, arms)
+        assert np.array_equal(U, U_rebuilt)
+        assert np.array_equal(C, C_rebuilt)
+
+    def test_seed(self):
+        """Reseeding should take effect immediately, discarding pooled random numbers."""
+        arms = [0, 1, 2, 3]
+        alg1 = RUCB()
+        alg1.choose_action_set(1, arms)  # fills the pool from the unseeded generator
+        alg1.seed(0)
+        alg2 = RUCB()
+        alg2.seed(0)
+        for t in range(1, 100):
+            A_t = alg1.choose_action_set(t, arms)
+            assert A_t == alg2.choose_action_set(t, arms)
+            alg1.record_action(t, A_t, A_t[0])
+            alg2.record_action(t, A_t, A_t[0])
+
+    def test_W_in_place_edit(self):
+        """Editing W in place is not allowed; assigning a new W must invalidate the caches."""
+        alg = RUCB()
+        alg.choose_action_set(1, [0, 1, 2])
+        W = np.array([[100, 0, 0], [50, 100, 10], [100, 90, 100]])
+        with pytest.raises(ValueError):
+            alg.W[:] = W
+
+        alg.W = W
+        W[:] = 0  # W is copied, so this has no effect on the policy
+        assert sorted(alg.choose_action_set(1e7, [0, 1, 2])) == [1, 2]
+
+    def test_W_reassigned(self):
+        """Assigning W after the first step should re-create or re-check it, even with the same arms list."""
+        arms = [0, 1, 2]
+        alg = RUCB()
+        alg.choose_action_set(1, arms)
+        alg.W = None
+        alg.choose_action_set(2, arms)
+        assert np.array_equal(alg.W, np.zeros((3, 3)))
+
+        alg.W = np.zeros((2, 2), dtype=np.int32)
+        with pytest.raises(AssertionError):
+            alg.choose_action_set(3, arms)
+
+    def test_numexpr_U_matches(self, monkeypatch):
+        """U computed with numexpr should match the NumPy version exactly (ties depend on it)."""
+        if alg_module.ne is None:
+            pytest.skip("numexpr not installed")
+        alg = RUCB()
+        arms = list(range(20))
+        alg.W = np.random.default_rng(0).integers(0, 50, size=(20, 20), dtype=np.int32)
+        U, C = alg._get_U_and_C(50, arms)
+        U = U.copy()  # U is a scratch buffer
+
+        monkeypatch.setattr(alg_module, "_NUMEXPR_MIN_SIZE", 0)
+        U_ne, C_ne = alg._get_U_and_C(50, arms)
+        assert np.array_equal(U, U_ne)
+        assert np.array_equal(C, C_ne)
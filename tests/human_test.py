@@ -7,7 +7,10 @@ from ind_acb.misc import beta_dist_max_prob
 
 def _exact_prob_matches(policy, time: int, a1: int, a2: int, N: int = 10_000):
     expected_prob = policy.action_choice_prob(time, a1, a2)
-    observed_choices = Counter([policy.choose_action(time, [a1, a2]) for _ in range(N)])
+    if hasattr(policy, "choose_action_many"):
+        observed_choices = Counter(policy.choose_action_many(time, [a1, a2], N))
+    else:
+        observed_choices = Counter([policy.choose_action(time, [a1, a2]) for _ in range(N)])
     observed_prob = observed_choices[a1] / N
     assert abs(expected_prob - observed_prob) < 0.05
 
@@ -76,6 +79,34 @@ class TestHumanThompsonSampling(BaseHumanTest):
         _exact_prob_matches(policy, time=4, a1=0, a2=2)
         _exact_prob_matches(policy, time=4, a1=1, a2=2)
 
+    def test_seed(self):
+        """Two policies with the same seed should make identical choices."""
+        policies = [self._make_policy() for _ in range(2)]
+        for policy in policies:
+            policy.seed(0)
+        actions = [[policy.choose_action(4, [0, 1, 2]) for _ in range(100)] for policy in policies]
+        assert actions[0] == actions[1]
+        many = [policy.choose_action_many(4, [0, 1, 2], 100) for policy in policies]
+        assert many[0] == many[1]
+
+    def test_exact_prob_cache(self, monkeypatch):
+        """Memoized probabilities should be reused, and invalidated when the posterior changes."""
+        calls = []
+
+        def counting_beta_dist_max_prob(*args):
+            calls.append(args)
+            return beta_dist_max_prob(*args)
+
+        monkeypatch.setattr(human, "beta_dist_max_prob", counting_beta_dist_max_prob)
+        policy = self._make_policy()
+        p = policy.action_choice_prob(4, 0, 1)
+        assert policy.action_choice_prob(4, 0, 1) == p
+        assert len(calls) == 1
+
+        policy.record_reward(4, 0, 1.0)
+        assert math.isclose(policy.action_choice_prob(5, 0, 1), beta_dist_max_prob([3, 2], [5, 6], 0))
+        assert len(calls) == 2
+
     def test_choose_action(self):
         policy = self._make_policy()
 
@@ -1,6 +1,6 @@
 import math
 
-from ind_acb.misc import beta_dist_max_prob
+from ind_acb.misc import CachedLog, beta_dist_max_prob
 
 
 class TestBetaDistMaxProb:
@@ -26,3 +26,10 @@ class TestBetaDistMaxProb:
         expected = [0.38461538461538447, 0.10139860139860139, 0.5139860139860138]
         for i, exp in enumerate(expected):
             assert math.isclose(beta_dist_max_prob(alpha, beta, i), exp)
+
+
+class TestCachedLog:
+    def test_values(self):
+        log = CachedLog()
+        for x in [1, 1, 4, 4, 2.5, 1]:
+            assert log(x) == math.log(x)